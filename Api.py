@@ -1,256 +1,628 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
-from pydantic import BaseModel
-from typing import Dict, Any
-from datetime import datetime, timedelta
-import httpx, os, uuid, secrets, json, jwt
-
-# -----------------------------------------------------
-# INIT
-# -----------------------------------------------------
-app = FastAPI(title="Paradym Login Verifier API (met automatische JWT)")
-
-# ⚙️ Configuration
-BASE_URL = os.getenv("BASE_URL", "https://dockerapi-aika.onrender.com")
-PARADYM_BASE = "https://api.paradym.id"
-PARADYM_API_KEY = os.getenv(
-    "PARADYM_API_KEY",
-    "paradym_e230f2ddfe60f9f3b74137e538354863015a678e98336a04a099a22215cea79c"
-)
-PROJECT_ID = os.getenv("PARADYM_PROJECT_ID", "cmhnkcs29000601s6dimvb8hh")
-PRESENTATION_TEMPLATE_ID = os.getenv("PARADYM_TEMPLATE_ID", "cmi2yvv8c009is601pojhv310")
-
-# -----------------------------------------------------
-# JWT CONFIG
-# -----------------------------------------------------
-def read_secret_file(path: str) -> str:
-    try:
-        with open(path, "r") as f:
-            return f.read().strip()
-    except Exception as e:
-        print(f"[ERROR] Kon secret file niet lezen ({path}): {e}", flush=True)
-        return None
-
-JWT_PRIVATE_KEY = read_secret_file("/etc/secrets/ec_private.pem")
-JWT_PUBLIC_KEY = read_secret_file("/etc/secrets/ec_public.pem")
-JWT_ISSUER = "ParadymVerifier"
-JWT_EXP_MINUTES = 100
-
-if not JWT_PRIVATE_KEY:
-    print("[WARN] ❌ Private key niet gevonden")
-if not JWT_PUBLIC_KEY:
-    print("[WARN] ❌ Public key niet gevonden")
-
-# -----------------------------------------------------
-# MIDDLEWARE
-# -----------------------------------------------------
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# -----------------------------------------------------
-# DATA STORE (in-memory)
-# -----------------------------------------------------
-sessions: Dict[str, Any] = {}
-
-# -----------------------------------------------------
-# MODELS
-# -----------------------------------------------------
-class PresentationRequest(BaseModel):
-    issuer: str = "local"
-    purpose: str = "Login"
-
-# -----------------------------------------------------
-# HELPERS
-# -----------------------------------------------------
-def now_iso() -> str:
-    return datetime.utcnow().isoformat()
-
-def safe_print(msg: str):
-    try:
-        print(msg, flush=True)
-    except Exception:
-        pass
-
-def generate_jwt(holder: str, attrs: dict = None) -> str:
-    """Genereer JWT met ES256."""
-    if not JWT_PRIVATE_KEY:
-        raise RuntimeError("Private key ontbreekt")
-
-    now = datetime.utcnow()
-    payload = {
-        "sub": holder,
-        "iss": JWT_ISSUER,
-        "iat": now,
-        "exp": now + timedelta(minutes=JWT_EXP_MINUTES)
-    }
-    if attrs:
-        payload.update(attrs)
-
-    token = jwt.encode(payload, JWT_PRIVATE_KEY, algorithm="ES256")
-    return token
-
-async def get_paradym_status(presentation_id: str) -> dict:
-    """Haal status bij Paradym."""
-    url = f"{PARADYM_BASE}/v1/projects/{PROJECT_ID}/openid4vc/verification/{presentation_id}"
-    headers = {"x-access-token": PARADYM_API_KEY}
-
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        resp = await client.get(url, headers=headers)
-        if resp.status_code != 200:
-            safe_print(f"[WARN] Paradym API {resp.status_code}: {resp.text}")
-            return {"error": str(resp.status_code), "raw": resp.text}
-        try:
-            return resp.json()
-        except Exception as e:
-            safe_print(f"[ERROR] Invalid JSON: {e}")
-            return {"error": "invalid_json"}
-
-# -----------------------------------------------------
-# ROUTES
-# -----------------------------------------------------
-@app.get("/")
-async def root():
-    return {
-        "status": "running",
-        "service": "Paradym Login Verifier API",
-        "project_id": PROJECT_ID,
-        "template_id": PRESENTATION_TEMPLATE_ID,
-        "base_url": BASE_URL,
-    }
-
-# -----------------------------------------------------
-# 1️⃣ Create verification request
-# -----------------------------------------------------
-@app.post("/request/create")
-async def create_request(req: PresentationRequest):
-    request_id = str(uuid.uuid4())
-    state = secrets.token_urlsafe(32)
-
-    payload = {
-        "presentationTemplateId": PRESENTATION_TEMPLATE_ID,
-        "redirect_uri": f"{BASE_URL}/presentation/{request_id}",
-        "state": state,
-    }
-
-    headers = {"x-access-token": PARADYM_API_KEY, "Content-Type": "application/json"}
-    api_url = f"{PARADYM_BASE}/v1/projects/{PROJECT_ID}/openid4vc/verification/request"
-
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        resp = await client.post(api_url, headers=headers, json=payload)
-
-    if resp.status_code not in (200, 201):
-        return JSONResponse(status_code=resp.status_code, content={"error": resp.text})
-
-    data = resp.json()
-    pres_id = data.get("id")
-    sessions[request_id] = {
-        "status": "pending",
-        "state": state,
-        "presentation_id": pres_id,
-        "verified": False,
-        "created_at": now_iso(),
-    }
-
-    safe_print(f"[DEBUG] ✅ Created verification request {request_id}")
-    return {
-        "request_id": request_id,
-        "openid_url": data.get("authorizationRequestUri"),
-        "openid_qr_url": data.get("authorizationRequestQrUri"),
-        "presentation_id": pres_id,
-    }
-
-# -----------------------------------------------------
-# 2️⃣ Handle Paradym redirect
-# -----------------------------------------------------
-@app.get("/presentation/{request_id}")
-async def presentation_redirect(request_id: str, request: Request):
-    params = dict(request.query_params)
-    verified = params.get("verified", "true").lower() == "true"
-    holder = params.get("holder") or params.get("subject") or "unknown"
-
-    sessions[request_id] = {
-        "status": "completed" if verified else "failed",
-        "verified": verified,
-        "holder": holder,
-        "params": params,
-        "completed_at": now_iso(),
-    }
-
-    return PlainTextResponse("✅ Verificatie voltooid. Je mag dit venster sluiten.")
-
-# -----------------------------------------------------
-# 3️⃣ Check status + auto-JWT
-# -----------------------------------------------------
-@app.get("/presentation/{request_id}/status")
-async def get_status(request_id: str):
-    sess = sessions.get(request_id)
-    if not sess:
-        raise HTTPException(status_code=404, detail="Not found")
-
-    # Update status vanuit Paradym
-    if sess.get("status") == "pending":
-        result = await get_paradym_status(sess["presentation_id"])
-        if (result.get("status") or "").lower() == "verified":
-            cred = result["credentials"][0]
-            attrs = cred.get("presentedAttributes", {})
-            holder = cred.get("holder") or attrs.get("cnf", {}).get("kid", "unknown")
-            sess.update({
-                "status": "completed",
-                "verified": True,
-                "result": result,
-                "holder": holder,
-                "completed_at": now_iso()
-            })
-            jwt_token = generate_jwt(holder, {"role": attrs.get("role"), "gemeente": attrs.get("gemeente")})
-            sess["jwt_token"] = jwt_token
-            safe_print(f"[DEBUG] ✅ JWT generated for {request_id}")
-
-    if sess.get("verified") and "jwt_token" not in sess:
-        # nog geen token? maak alsnog
-        result = sess.get("result", {})
-        cred = result.get("credentials", [{}])[0]
-        attrs = cred.get("presentedAttributes", {})
-        holder = sess.get("holder", "unknown")
-        sess["jwt_token"] = generate_jwt(holder, {"role": attrs.get("role"), "gemeente": attrs.get("gemeente")})
-
-    return sess
-
-# -----------------------------------------------------
-# 4️⃣ Public key endpoint
-# -----------------------------------------------------
-@app.get("/.well-known/jwks.json")
-async def jwks():
-    if not JWT_PUBLIC_KEY:
-        raise HTTPException(status_code=404, detail="Public key niet gevonden")
-    return {"algorithm": "ES256", "public_key": JWT_PUBLIC_KEY, "issuer": JWT_ISSUER}
-
-# -----------------------------------------------------
-# 5️⃣ Frontend bestanden
-# -----------------------------------------------------
-@app.get("/frontend")
-async def serve_frontend():
-    path = os.path.join(os.path.dirname(__file__), "index.html")
-    if not os.path.exists(path):
-        return PlainTextResponse("Frontend niet gevonden.")
-    return FileResponse(path)
-
-@app.get("/dashboard.html")
-async def serve_dashboard():
-    path = os.path.join(os.path.dirname(__file__), "dashboard.html")
-    if not os.path.exists(path):
-        return PlainTextResponse("Upload dashboard.html naast dit bestand.")
-    return FileResponse(path)
-
-# -----------------------------------------------------
-# RUN LOCAL
-# -----------------------------------------------------
-if __name__ == "__main__":
-    import uvicorn
-    safe_print("🚀 Starting Paradym Login Verifier API (auto-JWT mode) on port 8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, Any
+from datetime import datetime, timezone
+import asyncio
+import httpx, os, base64, secrets, orjson, jwt, hashlib, time, logging
+import redis.asyncio as aioredis
+from contextlib import asynccontextmanager
+from starlette.background import BackgroundTask
+from functools import lru_cache
+from cryptography.hazmat.primitives import serialization
+
+# -----------------------------------------------------
+# INIT
+# -----------------------------------------------------
+# print() blokkeert de event loop bij een trage stdout-pipe; logging
+# buffert netjes en debug-regels kosten niets als het level hoger staat.
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("paradym_verifier")
+
+# Eén gedeelde httpx-client met keep-alive pool: scheelt een TCP+TLS
+# handshake naar api.paradym.id op elke request.
+paradym_client: httpx.AsyncClient = None
+
+# Simpele teller + debug-regel per upstream-call; op DEBUG zie je aan het
+# http-versienummer en de teller of de keep-alive pool echt hergebruikt wordt.
+_paradym_calls = 0
+
+async def _log_paradym_response(response: httpx.Response):
+    global _paradym_calls
+    _paradym_calls += 1
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"Paradym call #{_paradym_calls}: {response.request.method} "
+            f"{response.request.url.path} -> {response.status_code} ({response.http_version})"
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global paradym_client
+    paradym_client = httpx.AsyncClient(
+        base_url=PARADYM_BASE,
+        timeout=30.0,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        headers={"x-access-token": PARADYM_API_KEY},
+        event_hooks={"response": [_log_paradym_response]},
+    )
+    poller = asyncio.create_task(poll_pending_sessions())
+    yield
+    poller.cancel()
+    await paradym_client.aclose()
+
+# orjson serialiseert 3-10x sneller dan stdlib json en schrijft direct bytes
+app = FastAPI(
+    title="Paradym Login Verifier API (met automatische JWT)",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
+
+# ⚙️ Configuration
+BASE_URL = os.getenv("BASE_URL", "https://dockerapi-aika.onrender.com")
+PARADYM_BASE = "https://api.paradym.id"
+PARADYM_API_KEY = os.getenv(
+    "PARADYM_API_KEY",
+    "paradym_e230f2ddfe60f9f3b74137e538354863015a678e98336a04a099a22215cea79c"
+)
+PROJECT_ID = os.getenv("PARADYM_PROJECT_ID", "cmhnkcs29000601s6dimvb8hh")
+PRESENTATION_TEMPLATE_ID = os.getenv("PARADYM_TEMPLATE_ID", "cmi2yvv8c009is601pojhv310")
+
+# Vaste URL-delen één keer opbouwen i.p.v. per request f-strings plakken
+# (paden relatief aan PARADYM_BASE, de base_url van de gedeelde client)
+VERIFICATION_REQUEST_PATH = f"/v1/projects/{PROJECT_ID}/openid4vc/verification/request"
+VERIFICATION_STATUS_PREFIX = f"/v1/projects/{PROJECT_ID}/openid4vc/verification/"
+REDIRECT_URI_PREFIX = f"{BASE_URL}/presentation/"
+
+# Alleen redirect_uri en state verschillen per request
+BASE_VERIFICATION_PAYLOAD = {"presentationTemplateId": PRESENTATION_TEMPLATE_ID}
+
+# -----------------------------------------------------
+# JWT CONFIG
+# -----------------------------------------------------
+@lru_cache(maxsize=None)
+def read_secret_file(path: str) -> str:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except Exception as e:
+        logger.error(f"Kon secret file niet lezen ({path}): {e}")
+        return None
+
+# De private key één keer parsen naar een EC-key-object; anders doet PyJWT
+# de (dure) PEM-parse opnieuw bij elke jwt.encode.
+_private_pem = read_secret_file("/etc/secrets/ec_private.pem")
+JWT_PRIVATE_KEY = None
+if _private_pem:
+    try:
+        JWT_PRIVATE_KEY = serialization.load_pem_private_key(_private_pem.encode(), password=None)
+    except Exception as e:
+        logger.error(f"Private key PEM ongeldig: {e}")
+
+JWT_PUBLIC_KEY = read_secret_file("/etc/secrets/ec_public.pem")
+JWT_ISSUER = "ParadymVerifier"
+
+# JWKS één keer opbouwen als echte JWK (kty/crv/x/y) en alvast naar bytes
+# serialiseren — het endpoint hoeft dan alleen nog die bytes terug te geven.
+JWKS_BYTES = None
+if JWT_PUBLIC_KEY:
+    try:
+        _pub_nums = serialization.load_pem_public_key(JWT_PUBLIC_KEY.encode()).public_numbers()
+        _jwk_x = base64.urlsafe_b64encode(_pub_nums.x.to_bytes(32, "big")).rstrip(b"=").decode()
+        _jwk_y = base64.urlsafe_b64encode(_pub_nums.y.to_bytes(32, "big")).rstrip(b"=").decode()
+        JWKS_BYTES = orjson.dumps({
+            "keys": [{
+                "kty": "EC",
+                "crv": "P-256",
+                "alg": "ES256",
+                "use": "sig",
+                "kid": hashlib.blake2b((_jwk_x + _jwk_y).encode(), digest_size=8).hexdigest(),
+                "x": _jwk_x,
+                "y": _jwk_y,
+            }]
+        })
+    except Exception as e:
+        logger.error(f"Public key PEM ongeldig: {e}")
+JWT_EXP_MINUTES = 100
+JWT_EXP_SECONDS = JWT_EXP_MINUTES * 60
+
+if not JWT_PRIVATE_KEY:
+    logger.warning("❌ Private key niet gevonden")
+if not JWT_PUBLIC_KEY:
+    logger.warning("❌ Public key niet gevonden")
+
+# -----------------------------------------------------
+# MIDDLEWARE
+# -----------------------------------------------------
+# Concrete origins i.p.v. "*": scheelt preflights en is ook gewoon netter.
+# Extra origins (bijv. een lokale frontend) via ALLOWED_ORIGINS=a,b,c
+ALLOWED_ORIGINS = [o for o in os.getenv("ALLOWED_ORIGINS", BASE_URL).split(",") if o]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type"],
+)
+
+# Comprimeer grotere JSON-responses (o.a. de volledige Paradym result-dump)
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# -----------------------------------------------------
+# DATA STORE (Redis, met in-memory fallback)
+# -----------------------------------------------------
+# Met meerdere uvicorn workers ziet elke worker anders zijn eigen sessies.
+# Zet REDIS_URL om sessies te delen; zonder REDIS_URL (lokaal dev) valt de
+# app terug op een lokale dict.
+REDIS_URL = os.getenv("REDIS_URL")
+SESSION_TTL_SECONDS = 600  # verlopen flows ruimen zichzelf op
+
+redis_client = None
+if REDIS_URL:
+    redis_client = aioredis.Redis.from_url(
+        REDIS_URL,
+        max_connections=50,
+        decode_responses=True,
+    )
+else:
+    logger.warning("REDIS_URL niet gezet — sessies blijven in-memory (1 worker!)")
+
+# Fallback store zonder Redis: zelfde TTL-gedrag, plus een harde cap zodat
+# een vergeten/gespamde flow het geheugen niet vol laat lopen.
+SESSION_MAX_ENTRIES = 1000
+
+sessions: Dict[str, Any] = {}
+_session_expiry: Dict[str, float] = {}
+
+def _prune_sessions():
+    now = time.monotonic()
+    for rid in [rid for rid, exp in _session_expiry.items() if exp < now]:
+        sessions.pop(rid, None)
+        _session_expiry.pop(rid, None)
+    # dicts zijn insertion-ordered: bij overflow vliegt de oudste eruit
+    while len(sessions) > SESSION_MAX_ENTRIES:
+        oldest = next(iter(sessions))
+        sessions.pop(oldest, None)
+        _session_expiry.pop(oldest, None)
+
+async def save_session(request_id: str, sess: dict):
+    if redis_client:
+        await redis_client.set(f"sess:{request_id}", orjson.dumps(sess), ex=SESSION_TTL_SECONDS)
+    else:
+        # pop + herinsert: recent gebruikte sessies achteraan (LRU-achtig)
+        sessions.pop(request_id, None)
+        sessions[request_id] = sess
+        _session_expiry[request_id] = time.monotonic() + SESSION_TTL_SECONDS
+        _prune_sessions()
+
+async def load_session(request_id: str) -> dict | None:
+    if redis_client:
+        raw = await redis_client.get(f"sess:{request_id}")
+        return orjson.loads(raw) if raw else None
+    exp = _session_expiry.get(request_id)
+    if exp is not None and exp < time.monotonic():
+        sessions.pop(request_id, None)
+        _session_expiry.pop(request_id, None)
+        return None
+    return sessions.get(request_id)
+
+# -----------------------------------------------------
+# HELPERS
+# -----------------------------------------------------
+# Timestamps zijn alleen voor de sessie-administratie; seconde-resolutie is
+# genoeg, dus de iso-string wordt per seconde maar één keer geformatteerd.
+_now_cache = (0, "")
+
+def now_iso() -> str:
+    global _now_cache
+    t = int(time.time())
+    if t != _now_cache[0]:
+        # now(timezone.utc): utcnow() is deprecated sinds 3.12 en naive;
+        # timespec="seconds" — meer precisie zou toch per seconde stale zijn
+        _now_cache = (t, datetime.now(timezone.utc).isoformat(timespec="seconds"))
+    return _now_cache[1]
+
+def generate_jwt(holder: str, attrs: dict = None) -> str:
+    """Genereer JWT met ES256."""
+    if not JWT_PRIVATE_KEY:
+        raise RuntimeError("Private key ontbreekt")
+
+    # iat/exp direct als epoch-ints: scheelt twee datetime-objecten plus de
+    # timestamp-conversie die PyJWT er anders zelf van maakt
+    now = int(time.time())
+    payload = {
+        "sub": holder,
+        "iss": JWT_ISSUER,
+        "iat": now,
+        "exp": now + JWT_EXP_SECONDS
+    }
+    if attrs:
+        payload.update(attrs)
+
+    token = jwt.encode(payload, JWT_PRIVATE_KEY, algorithm="ES256")
+    return token
+
+# Meerdere tabbladen/pollers voor dezelfde sessie delen één uitstaande
+# Paradym-call i.p.v. er elk zelf een te doen.
+_inflight_status: Dict[str, asyncio.Task] = {}
+
+# Resultaten heel even (2s) bewaren: sneller dan de frontend-pollfrequentie,
+# dus rappe opeenvolgende polls kosten geen extra Paradym-call.
+STATUS_CACHE_TTL = 2.0
+_status_cache: Dict[str, tuple] = {}  # presentation_id -> (expiry, result)
+
+async def get_paradym_status(presentation_id: str) -> dict:
+    """Haal status bij Paradym (gelijktijdige lookups gecoalesced, kort gecachet)."""
+    cached = _status_cache.get(presentation_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    task = _inflight_status.get(presentation_id)
+    if task is None:
+        task = asyncio.create_task(_fetch_paradym_status(presentation_id))
+        _inflight_status[presentation_id] = task
+        task.add_done_callback(lambda _: _inflight_status.pop(presentation_id, None))
+    result = await task
+    _status_cache[presentation_id] = (time.monotonic() + STATUS_CACHE_TTL, result)
+    if len(_status_cache) > 256:
+        now_m = time.monotonic()
+        for pid in [pid for pid, v in _status_cache.items() if v[0] <= now_m]:
+            _status_cache.pop(pid, None)
+    return result
+
+async def _fetch_paradym_status(presentation_id: str) -> dict:
+    resp = await paradym_client.get(VERIFICATION_STATUS_PREFIX + presentation_id, timeout=20.0)
+    if resp.status_code != 200:
+        logger.warning(f"Paradym API {resp.status_code}: {resp.text}")
+        return {"error": str(resp.status_code), "raw": resp.text}
+    try:
+        # orjson direct op de raw bytes; resp.json() gaat via str + stdlib json
+        return orjson.loads(resp.content)
+    except Exception as e:
+        logger.error(f"Invalid JSON: {e}")
+        return {"error": "invalid_json"}
+
+# -----------------------------------------------------
+# BACKGROUND POLLER
+# -----------------------------------------------------
+# Eén sweep-taak checkt alle pending sessies (van deze worker) bij Paradym,
+# zodat requests zelf vooral store-reads blijven.
+POLL_INTERVAL_SECONDS = 3.0
+
+_pending_ids: set = set()
+
+async def _sweep_pending(request_id: str):
+    sess = await load_session(request_id)
+    if not sess or sess.get("status") != "pending":
+        _pending_ids.discard(request_id)
+        return
+    sess = await refresh_session(request_id, sess)
+    if sess.get("status") != "pending":
+        _pending_ids.discard(request_id)
+
+async def poll_pending_sessions():
+    while True:
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        if not _pending_ids:
+            continue
+        try:
+            await asyncio.gather(*[_sweep_pending(rid) for rid in list(_pending_ids)])
+        except Exception as e:
+            logger.warning(f"Achtergrond-poll mislukt: {e}")
+
+# -----------------------------------------------------
+# ROUTES
+# -----------------------------------------------------
+# Deze responses zijn constant — één keer naar bytes en klaar.
+ROOT_BYTES = orjson.dumps({
+    "status": "running",
+    "service": "Paradym Login Verifier API",
+    "project_id": PROJECT_ID,
+    "template_id": PRESENTATION_TEMPLATE_ID,
+    "base_url": BASE_URL,
+})
+HEALTHZ_BYTES = orjson.dumps({"status": "ok"})
+OPENID_CONFIG_BYTES = orjson.dumps({
+    "issuer": JWT_ISSUER,
+    "jwks_uri": f"{BASE_URL}/.well-known/jwks.json",
+    "id_token_signing_alg_values_supported": ["ES256"],
+})
+
+# Korte max-age: genoeg om een rij load-balancer/uptime-checks achter één
+# gecachte response te laten vallen, kort genoeg om een deploy snel te zien.
+@app.get("/")
+async def root():
+    return Response(content=ROOT_BYTES, media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=30"})
+
+@app.get("/healthz")
+async def healthz():
+    return Response(content=HEALTHZ_BYTES, media_type="application/json",
+                    headers={"Cache-Control": "public, max-age=5"})
+
+@app.get("/.well-known/openid-configuration")
+async def openid_configuration(request: Request):
+    return _cacheable_json(OPENID_CONFIG_BYTES, OPENID_CONFIG_ETAG, request)
+
+# -----------------------------------------------------
+# 1️⃣ Create verification request
+# -----------------------------------------------------
+# NB: de request-body (issuer/purpose vanuit de frontend) werd nooit
+# gebruikt — het presentation template bepaalt alles. Body wordt dus ook
+# niet meer geparsed/gevalideerd.
+@app.post("/request/create")
+async def create_request():
+    # Eén draw van 32 random bytes levert beide tokens (elk 128 bits)
+    raw = os.urandom(32)
+    request_id = raw[:16].hex()
+    state = base64.urlsafe_b64encode(raw[16:]).rstrip(b"=").decode()
+
+    # Sessie vóór de Paradym-call wegschrijven: een wallet die heel snel
+    # redirect kan anders bij de callback aankomen voordat de sessie bestaat.
+    sess = {
+        "status": "pending",
+        "state": state,
+        "presentation_id": None,
+        "verified": False,
+        "created_at": now_iso(),
+    }
+    await save_session(request_id, sess)
+
+    payload = {
+        **BASE_VERIFICATION_PAYLOAD,
+        "redirect_uri": REDIRECT_URI_PREFIX + request_id,
+        "state": state,
+    }
+
+    resp = await paradym_client.post(VERIFICATION_REQUEST_PATH, json=payload)
+
+    if resp.status_code not in (200, 201):
+        return ORJSONResponse(status_code=resp.status_code, content={"error": resp.text})
+
+    data = orjson.loads(resp.content)
+    pres_id = data.get("id")
+    sess["presentation_id"] = pres_id
+    await save_session(request_id, sess)
+    _pending_ids.add(request_id)
+
+    logger.debug(f"✅ Created verification request {request_id}")
+    # Direct een ORJSONResponse: FastAPI slaat dan de jsonable_encoder-pass over
+    return ORJSONResponse({
+        "request_id": request_id,
+        "openid_url": data.get("authorizationRequestUri"),
+        "openid_qr_url": data.get("authorizationRequestQrUri"),
+        "presentation_id": pres_id,
+    })
+
+# -----------------------------------------------------
+# 2️⃣ Handle Paradym redirect
+# -----------------------------------------------------
+@app.get("/presentation/{request_id}")
+async def presentation_redirect(request_id: str, request: Request):
+    params = dict(request.query_params)
+    sess = await load_session(request_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="Not found or expired")
+
+    # State is verplicht en wordt in constante tijd vergeleken (geen
+    # timing-lek); weglaten telt als mismatch. Vergelijk als bytes —
+    # compare_digest op str gooit TypeError bij non-ASCII input.
+    given_state = params.get("state") or ""
+    if sess.get("state") and not secrets.compare_digest(sess["state"].encode(), given_state.encode()):
+        raise HTTPException(status_code=400, detail="State mismatch")
+
+    verified = params.get("verified", "true").lower() == "true"
+    holder = params.get("holder") or params.get("subject") or "unknown"
+
+    sess.update({
+        "status": "completed" if verified else "failed",
+        "verified": verified,
+        "holder": holder,
+        "params": params,
+        "completed_at": now_iso(),
+    })
+
+    # De wallet/browser hoeft niet op onze store-write te wachten; de save
+    # (en de SSE-wake-up daarna) draait zodra de response de deur uit is.
+    async def _persist():
+        await save_session(request_id, sess)
+        notify_session(request_id)
+
+    return PlainTextResponse(
+        "✅ Verificatie voltooid. Je mag dit venster sluiten.",
+        background=BackgroundTask(_persist),
+    )
+
+# -----------------------------------------------------
+# 3️⃣ Check status + auto-JWT
+# -----------------------------------------------------
+# Wakker-maak-registry per worker: de redirect-callback zet het event zodat
+# een open SSE-stream direct pusht i.p.v. de volgende poll-tik af te wachten.
+_session_events: Dict[str, asyncio.Event] = {}
+
+def notify_session(request_id: str):
+    ev = _session_events.get(request_id)
+    if ev:
+        ev.set()
+
+def status_view(sess: dict) -> dict:
+    """Compacte weergave voor de frontend: geen interne state, geen volledige
+    Paradym result-dump (die is vele KB's en de poller haalt hem elke 2s op)."""
+    view = {"status": sess.get("status"), "verified": sess.get("verified", False)}
+    for veld in ("holder", "jwt_token", "created_at", "completed_at", "error"):
+        if veld in sess:
+            view[veld] = sess[veld]
+    return view
+
+def session_etag(sess: dict) -> str:
+    """Zwakke ETag over de velden die de frontend interesseren."""
+    key = f"{sess.get('status')}:{sess.get('completed_at', '')}"
+    return 'W/"' + hashlib.blake2b(key.encode(), digest_size=8).hexdigest() + '"'
+
+async def refresh_session(request_id: str, sess: dict) -> dict:
+    """Poll Paradym zolang de sessie pending is en genereer de JWT bij succes."""
+    # Update status vanuit Paradym (presentation_id kan nog None zijn als de
+    # upstream-call in create_request niet lukte)
+    if sess.get("status") == "pending" and sess.get("presentation_id"):
+        result = await get_paradym_status(sess["presentation_id"])
+        if (result.get("status") or "").lower() == "verified":
+            cred = result["credentials"][0]
+            attrs = cred.get("presentedAttributes", {})
+            holder = cred.get("holder") or attrs.get("cnf", {}).get("kid", "unknown")
+            sess.update({
+                "status": "completed",
+                "verified": True,
+                "result": result,
+                "holder": holder,
+                "completed_at": now_iso()
+            })
+            jwt_token = generate_jwt(holder, {"role": attrs.get("role"), "gemeente": attrs.get("gemeente")})
+            sess["jwt_token"] = jwt_token
+            await save_session(request_id, sess)
+            notify_session(request_id)
+            logger.debug(f"✅ JWT generated for {request_id}")
+
+    if sess.get("verified") and "jwt_token" not in sess:
+        # nog geen token? maak alsnog
+        result = sess.get("result", {})
+        cred = result.get("credentials", [{}])[0]
+        attrs = cred.get("presentedAttributes", {})
+        holder = sess.get("holder", "unknown")
+        sess["jwt_token"] = generate_jwt(holder, {"role": attrs.get("role"), "gemeente": attrs.get("gemeente")})
+        await save_session(request_id, sess)
+
+    return sess
+
+@app.get("/presentation/{request_id}/status")
+async def get_status(request_id: str, request: Request):
+    sess = await load_session(request_id)
+    if not sess:
+        raise HTTPException(status_code=404, detail="Not found or expired")
+
+    sess = await refresh_session(request_id, sess)
+
+    # Polling-vriendelijk: niets veranderd? Dan volstaat een lege 304.
+    etag = session_etag(sess)
+    cache_control = "no-cache, must-revalidate" if sess.get("status") == "pending" else "max-age=60"
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    # Direct een ORJSONResponse: geen jsonable_encoder over de sessie heen
+    return ORJSONResponse(status_view(sess), headers={"ETag": etag, "Cache-Control": cache_control})
+
+# -----------------------------------------------------
+# 3️⃣b Status als Server-Sent Events (push i.p.v. pollen)
+# -----------------------------------------------------
+@app.get("/presentation/{request_id}/events")
+async def presentation_events(request_id: str):
+    """Houdt één verbinding open en pusht alleen echte statuswijzigingen."""
+    async def event_stream():
+        ev = _session_events.setdefault(request_id, asyncio.Event())
+        last_etag = None
+        try:
+            for _ in range(SESSION_TTL_SECONDS):
+                sess = await load_session(request_id)
+                if not sess:
+                    yield b"event: gone\ndata: {}\n\n"
+                    return
+                sess = await refresh_session(request_id, sess)
+                etag = session_etag(sess)
+                if etag != last_etag:
+                    last_etag = etag
+                    yield b"data: " + orjson.dumps(status_view(sess)) + b"\n\n"
+                    if sess.get("status") != "pending":
+                        return
+                # De callback maakt ons direct wakker; anders na 2s toch
+                # even bij Paradym kijken.
+                try:
+                    await asyncio.wait_for(ev.wait(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    pass
+                ev.clear()
+        finally:
+            _session_events.pop(request_id, None)
+
+    # Content-Encoding: identity houdt GZipMiddleware van de stream af —
+    # gzip buffert SSE-events anders tot de verbinding sluit.
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity",
+        },
+    )
+
+# -----------------------------------------------------
+# 4️⃣ Public key endpoint
+# -----------------------------------------------------
+# Keys en discovery-document veranderen alleen bij een redeploy; laat
+# verifiers ze dus gerust een uur cachen.
+def _bytes_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+JWKS_ETAG = _bytes_etag(JWKS_BYTES) if JWKS_BYTES else None
+OPENID_CONFIG_ETAG = _bytes_etag(OPENID_CONFIG_BYTES)
+
+def _cacheable_json(body: bytes, etag: str, request: Request) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    if not JWKS_BYTES:
+        raise HTTPException(status_code=404, detail="Public key niet gevonden")
+    return _cacheable_json(JWKS_BYTES, JWKS_ETAG, request)
+
+# -----------------------------------------------------
+# 5️⃣ Frontend bestanden
+# -----------------------------------------------------
+# HTML-bestanden één keer in het geheugen cachen (herladen bij nieuwe mtime)
+# zodat we niet per hit het bestand van disk lezen op de event loop.
+_static_cache: Dict[str, tuple] = {}  # filename -> (mtime, etag, bytes)
+
+def _load_static(filename: str):
+    path = os.path.join(os.path.dirname(__file__), filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _static_cache.get(filename)
+    if cached and cached[0] == mtime:
+        return cached
+    with open(path, "rb") as f:
+        body = f.read()
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    entry = (mtime, etag, body)
+    _static_cache[filename] = entry
+    return entry
+
+def _serve_static(filename: str, request: Request, missing_msg: str) -> Response:
+    entry = _load_static(filename)
+    if entry is None:
+        return PlainTextResponse(missing_msg)
+    _, etag, body = entry
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="text/html",
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/frontend")
+async def serve_frontend(request: Request):
+    return _serve_static("index.html", request, "Frontend niet gevonden.")
+
+@app.get("/dashboard.html")
+async def serve_dashboard(request: Request):
+    return _serve_static("dashboard.html", request, "Upload dashboard.html naast dit bestand.")
+
+# -----------------------------------------------------
+# RUN LOCAL
+# -----------------------------------------------------
+if __name__ == "__main__":
+    import uvicorn
+    logger.info("🚀 Starting Paradym Login Verifier API (auto-JWT mode) on port 8000")
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")